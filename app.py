@@ -1,9 +1,22 @@
 import streamlit as st
-import google.generativeai as genai
 import sqlite3
 import os
+import atexit
 import json
-import wandb
+import re
+import hashlib
+import queue
+import threading
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+try:
+    # orjson decodes the model's JSON replies a few times faster
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 # PAGE CONFIG
 st.set_page_config(
@@ -12,196 +25,87 @@ st.set_page_config(
     layout="centered"
 )
 
-st.markdown("""
-<style>
-    /* Full-page background (simplified for compatibility) */
-    body {
-        font-family: Arial, Helvetica, sans-serif;
-        background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-        color: #333;
-        margin: 0;
-        padding: 0;
-    }
-    
-    /* Main container */
-    .main {
-        background: rgba(255, 255, 255, 0.95);
-        border-radius: 15px;
-        box-shadow: 0 10px 30px rgba(0, 0, 0, 0.1);
-        padding: 20px;
-        margin: 20px auto;
-        max-width: 1200px;
-    }
-    
-    /* Title styling */
-    .stTitle {
-        font-family: Arial, Helvetica, sans-serif;
-        font-weight: bold;
-        color: #2c3e50;
-        text-align: center;
-        font-size: 2.5em;
-        margin-bottom: 10px;
-    }
-    
-    /* Caption styling */
-    .stCaption {
-        font-family: Arial, Helvetica, sans-serif;
-        font-weight: normal;
-        color: #7f8c8d;
-        font-style: italic;
-        text-align: center;
-        font-size: 1.1em;
-    }
-    
-    /* Divider styling */
-    hr {
-        border: none;
-        height: 2px;
-        background: linear-gradient(90deg, #3498db, #2ecc71);
-        margin: 20px 0;
-    }
-    
-    /* Selectbox and checkbox styling */
-    .stSelectbox, .stCheckbox {
-        background: #ecf0f1;
-        border-radius: 10px;
-        padding: 10px;
-        border: 1px solid #bdc3c7;
-        margin-bottom: 15px;
-    }
-    
-    /* Metric styling */
-    .stMetric {
-        background: linear-gradient(135deg, #3498db, #2980b9);
-        color: white;
-        border-radius: 15px;
-        padding: 20px;
-        text-align: center;
-        box-shadow: 0 5px 15px rgba(0, 0, 0, 0.2);
-        font-size: 1.5em;
-        font-weight: bold;
-    }
-    
-    /* Subheader styling */
-    .stSubheader {
-        font-family: Arial, Helvetica, sans-serif;
-        font-weight: bold;
-        color: #34495e;
-        border-left: 5px solid #2ecc71;
-        padding-left: 15px;
-        margin-top: 30px;
-    }
-    
-    /* Button styling */
-    .stButton button {
-        background: linear-gradient(135deg, #2ecc71, #27ae60);
-        color: white;
-        border: none;
-        border-radius: 25px;
-        padding: 12px 25px;
-        font-size: 1em;
-        font-weight: bold;
-        cursor: pointer;
-        transition: background 0.3s ease;
-        box-shadow: 0 4px 10px rgba(0, 0, 0, 0.2);
-    }
-    
-    .stButton button:hover {
-        background: linear-gradient(135deg, #27ae60, #229954);
-    }
-    
-    /* Text area styling */
-    .stTextArea textarea {
-        background: #f8f9fa;
-        border: 1px solid #dee2e6;
-        border-radius: 10px;
-        padding: 15px;
-        font-family: Arial, Helvetica, sans-serif;
-        font-size: 1em;
-        resize: vertical;
-    }
-    
-    /* Info and warning boxes */
-    .stInfo, .stWarning {
-        background: #d4edda;
-        border: 1px solid #c3e6cb;
-        border-radius: 10px;
-        padding: 15px;
-        margin: 10px 0;
-        color: #155724;
-    }
-    
-    .stWarning {
-        background: #fff3cd;
-        border-color: #ffeaa7;
-        color: #856404;
-    }
-    
-    /* Markdown styling */
-    .stMarkdown p {
-        font-size: 1.1em;
-        line-height: 1.6;
-    }
-    
-    /* Columns styling */
-    .stColumns {
-        gap: 20px;
-    }
-    
-    /* Footer styling */
-    .stCaption:last-of-type {
-        text-align: center;
-        margin-top: 40px;
-        font-size: 0.9em;
-        color: #95a5a6;
-    }
-    
-    /* Custom legend styling */
-    .legend {
-        display: flex;
-        justify-content: space-around;
-        background: #ecf0f1;
-        border-radius: 10px;
-        padding: 15px;
-        margin: 20px 0;
-    }
-    
-    .legend div {
-        text-align: center;
-        font-weight: bold;
-    }
-    
-    /* Responsive design */
-    @media (max-width: 768px) {
-        .stTitle {
-            font-size: 2em;
-        }
-        .stMetric {
-            font-size: 1.2em;
-        }
-        .legend {
-            flex-direction: column;
-            gap: 10px;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def load_css():
+    """
+    Read and minify the stylesheet once per process — the minified
+    form is what ships over the websocket on every rerun, so comments
+    and indentation are stripped up front.
+    """
+    with open("static/styles.css", encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r" ?([{};:,>]) ?", r"\1", css)
+    return f"<style>{css.strip()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Logging interactions to understand how billing items are interpreted
-try:
-    wandb.init(
-        project="medibill-ai",
-        name="billing-insurance-monitoring",
-        reinit=True
-    )
-except Exception:
-    # App should continue even if analytics fail
-    pass
+@st.cache_resource
+def get_wandb_run():
+    """
+    wandb.init happens exactly once per worker process instead of on
+    every rerun; the handshake is network I/O we don't want on the
+    hot path, and the import itself is deferred off cold start.
+    Returns None when analytics are unavailable.
+    """
+    try:
+        import wandb
+        return wandb.init(
+            project="medibill-ai",
+            name="billing-insurance-monitoring",
+            reinit=False,
+            settings=wandb.Settings(silent=True)
+        )
+    except Exception:
+        # App should continue even if analytics fail
+        return None
 
 # GEMINI SETUP
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("models/gemini-2.0-flash")
+# The static instructions ride on the model as a system instruction, so
+# each request only sends the short variable tail (language + item) and
+# Gemini's server-side prefix caching can reuse the shared part.
+# (Explicit CachedContent needs a ~4k-token minimum prefix, far larger
+# than this prompt, so the implicit route is the right fit here.)
+EXPLAIN_SYSTEM_PROMPT = """You are MediBill AI.
+Explain the given hospital bill item in simple terms and classify insurance coverage."""
+
+# With a response schema the literal JSON template in the prompt is
+# redundant — the API guarantees this shape
+EXPLAIN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "explanation": {"type": "string"},
+        "insurance_status": {
+            "type": "string",
+            "enum": ["LIKELY_COVERED", "PARTIALLY_COVERED", "NOT_COVERED"],
+        },
+        "insurance_note": {"type": "string"},
+        "disclaimer": {"type": "string"},
+    },
+    "required": ["explanation", "insurance_status", "insurance_note", "disclaimer"],
+}
+
+@st.cache_resource
+def get_models():
+    """
+    Import and configure the Gemini SDK on first use — the import costs
+    hundreds of ms we don't want on Streamlit cold start. Returns the
+    plain model and the schema-bound explanation model.
+    """
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return (
+        genai.GenerativeModel("models/gemini-2.0-flash"),
+        genai.GenerativeModel(
+            "models/gemini-2.0-flash",
+            system_instruction=EXPLAIN_SYSTEM_PROMPT
+        ),
+    )
+
 
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
 
 def extract_json(text):
     """
@@ -209,36 +113,367 @@ def extract_json(text):
     This keeps the app stable even if extra text slips in.
     """
 
+    # Fast path: with JSON output requested from the model, most replies
+    # are already pure JSON and need no slicing at all
     try:
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        return json.loads(text[start:end])
+        return json_loads(text)
     except Exception:
-        return None
+        pass
+
+    # Second tier: a markdown code fence around otherwise-clean JSON is
+    # the most common wrapper, and its contents parse in one shot
+    fence = _FENCE_RE.search(text)
+    if fence:
+        try:
+            return json_loads(fence.group(1))
+        except Exception:
+            pass
+
+    # Fallback: parse the first complete object in one pass. Unlike a
+    # first-{/last-} slice this still works when the reply carries
+    # several JSON blocks or trailing prose after the object.
+    decoder = json.JSONDecoder()
+    i = text.find("{")
+    while i != -1:
+        try:
+            obj, _ = decoder.raw_decode(text, i)
+            return obj
+        except json.JSONDecodeError:
+            i = text.find("{", i + 1)
+    return None
+
+_NORM_RE = re.compile(r"[^a-z0-9 ]+")
+
+def normalize_term(text):
+    """
+    Canonical form for cache keys: lowercased with punctuation removed,
+    so 'Paracetamol 500mg (IV)' and 'paracetamol 500mg IV' share one
+    cached answer instead of paying for two.
+    """
+    norm = " ".join(_NORM_RE.sub(" ", text.lower()).split())
+    return norm or text.lower()
 
 # DATABASE CONNECTION
+@st.cache_resource
+def get_db_connection():
+    """
+    One long-lived SQLite connection shared across reruns, so we
+    don't pay the connection-open cost on every fetch and SQLite's
+    page cache stays warm.
+    """
+    conn = sqlite3.connect("medibill.db", check_same_thread=False)
+    # Tune SQLite for fast repeated reads (WAL + relaxed sync + bigger
+    # cache + mmap); applied once since the connection is cached.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    # Gemini responses are persisted here so explanations survive
+    # restarts and are shared across Streamlit workers
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS gemini_cache ("
+        " prompt_sha256 TEXT PRIMARY KEY,"
+        " response TEXT NOT NULL,"
+        " created_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.commit()
+    return conn
+
+# Columns kept as parallel tuples rather than a list of dicts —
+# no per-row dict allocation and cheaper iteration in the render loop
+Bill = namedtuple("Bill", ["items", "categories", "costs"])
+
+@st.cache_data(ttl=60)
 def get_bill():
-    conn = sqlite3.connect("medibill.db")
-    cur = conn.cursor()
+    """
+    Cached so reruns (button clicks, language changes) reuse the
+    same bill data instead of hitting SQLite every time.
+    """
+    cur = get_db_connection().cursor()
     cur.execute("SELECT item_name, category, cost FROM bill_items")
     rows = cur.fetchall()
-    conn.close()
-    return [
-        {"item": r[0], "category": r[1], "cost": r[2]}
-        for r in rows
-    ]
+    if not rows:
+        return Bill((), (), ())
+    return Bill(*zip(*rows))
+
+@st.cache_data(ttl=60)
+def get_bill_summary():
+    """Item count and bill total in one aggregate pass inside SQLite."""
+    cur = get_db_connection().cursor()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(cost), 0) FROM bill_items")
+    return cur.fetchone()
+
+@st.cache_data(ttl=60)
+def get_category_subtotals():
+    """
+    Per-category subtotals via numpy's C-level bincount — categories
+    are mapped to integer ids once and the reduction never touches
+    Python bytecode, so this stays cheap as the bill grows.
+    """
+    bill = get_bill()
+    if not bill.items:
+        return {}
+    cats, cat_ids = np.unique(np.asarray(bill.categories), return_inverse=True)
+    sums = np.bincount(cat_ids, weights=np.asarray(bill.costs, dtype=np.float64))
+    return {cat: int(total) for cat, total in zip(cats, sums)}
+
+@st.cache_resource
+def get_response_cache():
+    """
+    Prompt-hash -> response text, shared across reruns and sessions.
+    Prompts are deterministic per (item, category, language), so repeat
+    clicks can skip the Gemini round-trip entirely.
+    """
+    return {}
+
+def response_cache_get(key):
+    """In-memory first, then the gemini_cache table on disk."""
+    cache = get_response_cache()
+    if key in cache:
+        return cache[key]
+    cur = get_db_connection().cursor()
+    cur.execute("SELECT response FROM gemini_cache WHERE prompt_sha256=?", (key,))
+    row = cur.fetchone()
+    if row:
+        # Promote disk hits so later lookups skip SQLite too
+        cache[key] = row[0]
+        return row[0]
+    return None
+
+def response_cache_put(key, text):
+    cache = get_response_cache()
+    cache[key] = text
+    conn = get_db_connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO gemini_cache (prompt_sha256, response) VALUES (?, ?)",
+        (key, text),
+    )
+    conn.commit()
 
-def safely_call_gemini(prompt):
+def safely_call_gemini(prompt, json_mode=False):
     """
     Small wrapper around the AI call to avoid breaking
     the app if the API times out or errors.
+
+    json_mode asks Gemini for application/json output so the reply
+    needs no brace-hunting before parsing.
     """
+    key = hashlib.sha256(prompt.encode()).hexdigest()
+    cached = response_cache_get(key)
+    if cached is not None:
+        return cached
+    config = (
+        {"response_mime_type": "application/json", "response_schema": EXPLAIN_SCHEMA}
+        if json_mode
+        else None
+    )
+    model, explain_model = get_models()
+    target = explain_model if json_mode else model
     try:
-        return model.generate_content(prompt).text
+        # Bounded timeout: a stuck request degrades to the FAILED
+        # message instead of hanging the card indefinitely
+        text = target.generate_content(
+            prompt,
+            generation_config=config,
+            request_options={"timeout": 30},
+        ).text
     except Exception:
         return None
+    # Failures are not cached, so a later click can retry
+    response_cache_put(key, text)
+    return text
+
+def stream_gemini(prompt):
+    """
+    Streaming variant of safely_call_gemini: yields chunks as the model
+    produces them so the UI can show text at time-to-first-token instead
+    of waiting for the full reply. Serves from the response cache when
+    the prompt was answered before.
+    """
+    key = hashlib.sha256(prompt.encode()).hexdigest()
+    cached = response_cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    try:
+        for chunk in get_models()[0].generate_content(prompt, stream=True):
+            parts.append(chunk.text)
+            yield chunk.text
+    except Exception:
+        # Stop streaming; whatever arrived is still shown
+        return
+    response_cache_put(key, "".join(parts))
+
+@st.cache_resource
+def get_wandb_queue():
+    """
+    Analytics events go onto this queue and a daemon thread forwards
+    them to wandb, so logging never stalls the user-facing rerun.
+    """
+    q = queue.Queue()
+
+    run = get_wandb_run()
+
+    def _drain():
+        while True:
+            # Gather whatever is queued (up to 32 events) and send it
+            # as one committed step instead of one HTTP write per event
+            batch = [q.get()]
+            while len(batch) < 32:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if run is not None:
+                    for event in batch[:-1]:
+                        run.log(event, commit=False)
+                    run.log(batch[-1])
+            except Exception:
+                # Analytics must never take the app down
+                pass
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    threading.Thread(target=_drain, daemon=True).start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(q.join)
+    return q
+
+@st.cache_resource
+def get_executor():
+    """Shared thread pool so independent AI calls can overlap."""
+    return ThreadPoolExecutor(max_workers=8)
+
+@st.cache_resource
+def get_prefetched():
+    """Prompt hashes already submitted for background prefetch."""
+    return set()
+
+@st.cache_resource
+def get_logged_analyses():
+    """Explain keys already reported to wandb, so cache hits and fragment
+    reruns don't re-log the same analysis."""
+    return set()
+
+def submit_with_ctx(fn, *args, **kwargs):
+    """
+    Submit fn to the shared pool with the caller's Streamlit script
+    context attached, so cache lookups and session_state access inside
+    worker threads don't hit 'missing ScriptRunContext'.
+    """
+    ctx = get_script_run_ctx()
+
+    def _task():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
 
-# HEADER 
+    return get_executor().submit(_task)
+
+def build_image_prompt(item, category):
+    return f"""
+Educational illustration description.
+Item: {item}
+Category: {category}
+Describe a clean, educational medical illustration.
+"""
+
+# Language -> prompt instruction, precomputed instead of branching per call
+LANG_RULES = {
+    "English": "Language: English.",
+    "Hindi": "Language: Hindi (Devanagari only).",
+    "Bengali": "Language: Bengali (বাংলা only).",
+}
+
+FAMILY_RULE = (
+    "Explain for a family member with no medical background, "
+    "in very simple everyday words.\n"
+)
+
+# Only the variable tail — the instructions live in
+# EXPLAIN_SYSTEM_PROMPT on the model. The cost is deliberately
+# absent: what an item is and how insurance treats it doesn't
+# depend on the price, and leaving it out lets every cost variant
+# of the same item share one cached answer.
+EXPLAIN_TAIL_TPL = """{lang_rule}
+{family_rule}Item: {item}
+Category: {category}
+"""
+
+def build_explain_prompt(item, category, language, family_mode):
+    return EXPLAIN_TAIL_TPL.format_map({
+        "lang_rule": LANG_RULES[language],
+        "family_rule": FAMILY_RULE if family_mode else "",
+        "item": item,
+        "category": category,
+    })
+
+class GeminiUnavailable(Exception):
+    """Raised on a failed AI call so the failure is never memoized."""
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def cached_explain(norm_item, norm_category, language, family_mode):
+    """
+    Parsed explanation memoized on the normalized fields that shape the
+    prompt, so equivalent charges — however the hospital spelled them —
+    hit the cache across reruns and sessions for a day instead of
+    re-spending a Gemini call.
+    """
+    raw = safely_call_gemini(
+        build_explain_prompt(norm_item, norm_category, language, family_mode),
+        json_mode=True,
+    )
+    result = extract_json(raw) if raw else None
+    if result is None:
+        # Exceptions are not cached by st.cache_data, so a retry works
+        raise GeminiUnavailable(norm_item)
+    return result
+
+def fetch_explain(item, category, language, family_mode):
+    """cached_explain on normalized terms, failures mapped to FAILED."""
+    try:
+        return cached_explain(
+            normalize_term(item), normalize_term(category),
+            language, family_mode
+        )
+    except GeminiUnavailable:
+        return "FAILED"
+
+@st.cache_resource
+def start_warmup():
+    """
+    One-shot, fire-and-forget pre-warm of explanations for the most
+    frequent bill items (default language/mode only, capped at 10
+    calls), so the first click on a common charge is a cache lookup
+    instead of a Gemini round-trip. Results persist in gemini_cache.
+    """
+    cur = get_db_connection().cursor()
+    cur.execute(
+        "SELECT item_name, category, COUNT(*) AS n FROM bill_items"
+        " GROUP BY item_name, category ORDER BY n DESC LIMIT 10"
+    )
+    for item, category, _ in cur.fetchall():
+        submit_with_ctx(fetch_explain, item, category, "English", False)
+    return True
+
+# Card header template, built once at import instead of per item per rerun
+CARD_TPL = (
+    "### {item}\n"
+    "**Category:** {category}  \n"
+    "**Cost:** ₹{cost}"
+)
+
+# Status -> badge lookup instead of an if/elif ladder per item
+STATUS_BADGES = {
+    "LIKELY_COVERED": "🟢 **This charge is likely covered by insurance**",
+    "PARTIALLY_COVERED": "🟡 **This charge may be partially covered**",
+    "NOT_COVERED": "🔴 **This charge is usually not covered**",
+}
+
+# HEADER
 st.title("🏥 MediBill AI")
 st.caption(
     "Helping patients and families understand hospital bills with clear explanations, "
@@ -264,43 +499,164 @@ with col2:
 # INSURANCE LEGEND
 st.markdown("---🛡️ Insurance Coverage Guide ---")
 
-l1, l2, l3 = st.columns(3)
-l1.markdown("🟢 **Likely Covered**  \nUsually included in standard policies")
-l2.markdown("🟡 **Partially Covered**  \nDepends on policy limits or conditions")
-l3.markdown("🔴 **Not Covered**  \nOften excluded from insurance")
+# One element using the stylesheet's .legend flexbox rather than three
+# columns with a markdown block each
+st.markdown(
+    '<div class="legend">'
+    "<div>🟢 <b>Likely Covered</b><br>Usually included in standard policies</div>"
+    "<div>🟡 <b>Partially Covered</b><br>Depends on policy limits or conditions</div>"
+    "<div>🔴 <b>Not Covered</b><br>Often excluded from insurance</div>"
+    "</div>",
+    unsafe_allow_html=True
+)
 
 st.divider()
 
 # BILL DATA
-items = get_bill()
-st.metric("💰 Total Hospital Bill So Far (₹)", sum(i["cost"] for i in items))
+bill = get_bill()
+start_warmup()
 
-st.divider()
+def state_key(kind, *parts):
+    """
+    Content-addressed session_state key. Duplicate line items (e.g. a
+    repeated medicine dose) hash to the same key, so one AI result is
+    shared instead of paying for a call per duplicate.
+    """
+    digest = hashlib.blake2b(
+        "|".join(str(p) for p in parts).encode(), digest_size=8
+    ).hexdigest()
+    return f"{kind}_{digest}"
+
+# Build each item's session_state keys once per rerun instead of
+# re-formatting them in every handler below. Explanation keys include
+# the language and family mode so switching either doesn't serve
+# stale text.
+exp_keys = [
+    state_key("explain", normalize_term(name), normalize_term(cat),
+              language, family_mode)
+    for name, cat in zip(bill.items, bill.categories)
+]
+img_keys = [
+    state_key("image", normalize_term(name), normalize_term(cat))
+    for name, cat in zip(bill.items, bill.categories)
+]
+item_count, bill_total = get_bill_summary()
+st.metric("💰 Total Hospital Bill So Far (₹)", bill_total)
+st.caption(f"{item_count} charges on the bill")
+
+with st.expander("📊 Subtotals by category"):
+    for cat, subtotal in get_category_subtotals().items():
+        st.markdown(f"**{cat}:** ₹{subtotal}")
+
+btn_refresh, btn_all = st.columns(2)
+
+if btn_refresh.button("🔄 Refresh bill"):
+    # Clear the cached query so newly added hospital charges show up
+    get_bill.clear()
+    get_bill_summary.clear()
+    get_category_subtotals.clear()
+    st.rerun()
+
+# ANALYZE EVERYTHING AT ONCE
+if btn_all.button("⚡ Analyze all items"):
+    # The per-item AI calls are independent and network-bound, so run
+    # them on the shared pool and wait for all instead of one-by-one.
+    # Keyed by state key so duplicate line items (which share a key)
+    # dispatch exactly one call per unique (item, category[, language])
+    pending = {}
+    for item, category, cost, exp_key, img_key in zip(
+        bill.items, bill.categories, bill.costs, exp_keys, img_keys
+    ):
+        if img_key not in st.session_state and img_key not in pending:
+            pending[img_key] = (
+                False,
+                submit_with_ctx(
+                    safely_call_gemini,
+                    build_image_prompt(item, category)
+                ),
+            )
+        if exp_key not in st.session_state and exp_key not in pending:
+            pending[exp_key] = (
+                True,
+                submit_with_ctx(
+                    fetch_explain,
+                    item, category, language, family_mode
+                ),
+            )
+    with st.spinner(f"💬 Analyzing {len(pending)} pending items…"):
+        for key, (parsed, future) in pending.items():
+            if parsed:
+                st.session_state[key] = future.result()
+            else:
+                st.session_state[key] = future.result() or "FAILED"
+
+# EXPLAIN A CHOSEN SUBSET
+# A form batches the selection into one rerun and one concurrent
+# dispatch, instead of a click-rerun round per item
+with st.form("explain_selected"):
+    picks = st.multiselect(
+        "🎯 Or pick a few items to explain together",
+        sorted(set(bill.items)),
+    )
+    if st.form_submit_button("Explain selected") and picks:
+        wanted = set(picks)
+        chosen = {}
+        for item, category, exp_key in zip(bill.items, bill.categories, exp_keys):
+            if (item in wanted
+                    and exp_key not in st.session_state
+                    and exp_key not in chosen):
+                chosen[exp_key] = submit_with_ctx(
+                    fetch_explain, item, category, language, family_mode
+                )
+        with st.spinner(f"💬 Explaining {len(chosen)} selected items…"):
+            for key, future in chosen.items():
+                st.session_state[key] = future.result()
+
+# BACKGROUND PREFETCH
+if st.toggle(
+    "🪄 Prepare visual descriptions in the background",
+    help="Uses idle time (and API quota) to pre-generate illustration "
+         "descriptions so the buttons below respond instantly."
+):
+    # Fire-and-forget: results land in the response cache, clicks then
+    # stream them straight from memory. Failures just mean the click
+    # falls back to a live call, so futures aren't awaited or checked.
+    seen = get_prefetched()
+    for item, category in zip(bill.items, bill.categories):
+        prompt = build_image_prompt(item, category)
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        if prompt_hash not in seen:
+            seen.add(prompt_hash)
+            submit_with_ctx(safely_call_gemini, prompt)
 
-#Details of all items on the list
-for i in items:
-    item = i["item"]
-    key_explain = f"explain_{item}"
-    key_image = f"image_{item}"
+st.divider()
 
-    st.subheader(item)
-    st.write(f"**Category:** {i['category']}")
-    st.write(f"**Cost:** ₹{i['cost']}")
+@st.fragment
+def render_item(idx, item, category, cost, key_explain, key_image,
+                language, family_mode):
+    """
+    One bill card. As a fragment, its buttons rerun only this card —
+    the other N-1 cards, the bill fetch and the page chrome are left
+    untouched by a click here.
+    """
+    # One markdown block per card instead of three separate calls —
+    # each Streamlit call is its own websocket message
+    st.markdown(CARD_TPL.format(item=item, category=category, cost=cost))
 
     colA, colB = st.columns(2)
 
     # IMAGE BUTTON 
-    if colA.button("🖼️ Learn what this medicine/procedure looks like", key=f"img_{item}"):
+    freshly_streamed = False
+    if colA.button("🖼️ Learn what this medicine/procedure looks like", key=f"img_{idx}"):
         if key_image not in st.session_state:
-            img_prompt = f"""
-Educational illustration description.
-Item: {item}
-Category: {i['category']}
-Describe a clean, educational medical illustration.
-"""
-            st.session_state[key_image] = safely_call_gemini(img_prompt) or "FAILED"
-
-    if key_image in st.session_state:
+            img_prompt = build_image_prompt(item, category)
+            # Render tokens as they arrive, then keep the full text
+            # around for later reruns
+            streamed = st.write_stream(stream_gemini(img_prompt))
+            st.session_state[key_image] = streamed or "FAILED"
+            freshly_streamed = streamed != ""
+
+    if key_image in st.session_state and not freshly_streamed:
         if st.session_state[key_image] == "FAILED":
             #if API hits daily limit for calls
             st.info(
@@ -318,36 +674,12 @@ Describe a clean, educational medical illustration.
             )
 
     # EXPLAIN BUTTON 
-    if colB.button("🧠 Understand this charge & insurance coverage", key=f"exp_{item}"):
+    if colB.button("🧠 Understand this charge & insurance coverage", key=f"exp_{idx}"):
         if key_explain not in st.session_state:
-            lang_rule = (
-                "Language: English."
-                if language == "English"
-                else "Language: Hindi (Devanagari only)."
-                if language == "Hindi"
-                else "Language: Bengali (বাংলা only)."
-            )
-            #JSON only enforced to ensure output in proper format
-            explain_prompt = f"""
-You are MediBill AI.
-{lang_rule}
-
-Explain this hospital bill item in simple terms and classify insurance coverage.
-
-Item: {item}
-Category: {i['category']}
-Cost: ₹{i['cost']}
-
-JSON only:
-{{
- "explanation": "...",
- "insurance_status": "LIKELY_COVERED|PARTIALLY_COVERED|NOT_COVERED",
- "insurance_note": "...",
- "disclaimer": "..."
-}}
-"""
-            raw = safely_call_gemini(explain_prompt)
-            st.session_state[key_explain] = extract_json(raw) if raw else "FAILED"
+            with st.spinner("💬 Asking MediBill AI about this charge…"):
+                st.session_state[key_explain] = fetch_explain(
+                    item, category, language, family_mode
+                )
 
     if key_explain in st.session_state:
         result = st.session_state[key_explain]
@@ -359,13 +691,7 @@ JSON only:
             )
         else:
             status = result["insurance_status"]
-
-            if status == "LIKELY_COVERED":
-                st.markdown("🟢 **This charge is likely covered by insurance**")
-            elif status == "PARTIALLY_COVERED":
-                st.markdown("🟡 **This charge may be partially covered**")
-            else:
-                st.markdown("🔴 **This charge is usually not covered**")
+            st.markdown(STATUS_BADGES.get(status, STATUS_BADGES["NOT_COVERED"]))
 
             st.write(result["explanation"])
             st.info(result["insurance_note"])
@@ -374,19 +700,28 @@ JSON only:
                 "professional medical or insurance advice."
             )
 
-            try:
-                wandb.log({
+            # Log each unique analysis once; repeat renders served from
+            # the caches shouldn't count as new events
+            logged = get_logged_analyses()
+            if key_explain not in logged:
+                logged.add(key_explain)
+                get_wandb_queue().put({
                     "item": item,
                     "insurance_status": status,
                     "language": language,
                     "family_mode": family_mode
                 })
-            except Exception:
-                 pass
 
     st.divider()
 
-# FOOTER 
+#Details of all items on the list
+for idx, (item, category, cost, key_explain, key_image) in enumerate(zip(
+    bill.items, bill.categories, bill.costs, exp_keys, img_keys
+)):
+    render_item(idx, item, category, cost, key_explain, key_image,
+                language, family_mode)
+
+# FOOTER
 st.caption(
     "MediBill AI is an educational tool designed to improve transparency in hospital billing. "
     "All information provided is for awareness and discussion purposes only."